@@ -1,19 +1,48 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.middleware.cors import CORSMiddleware
-from libsql_client import create_client
+from libsql_client import LibsqlError, create_client
 import os
+import asyncio
+import hashlib
+import shutil
+import socket
+import sqlite3
+import threading
+import tempfile
+import gzip
+import json
+import time
 import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter
+from typing import Dict, List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, date as calendar_date, timezone, timedelta
 from enum import Enum
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
+try:
+    import brotli
+except ImportError:  # optional: br is simply not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd is simply not offered
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # no file locks: every worker drains the spool
+    fcntl = None
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -114,6 +143,10 @@ class ContactMessageCreate(BaseModel):
     message: str = Field(..., min_length=1)
 
 
+booking_list_adapter = TypeAdapter(List[Booking])
+contact_message_list_adapter = TypeAdapter(List[ContactMessage])
+
+
 # Auth Helper Functions
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -134,6 +167,770 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
 
+# Response Compression
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+
+# Server-side preference order when the client weighs several encodings equally
+ENCODING_PREFERENCE = ("br", "zstd", "gzip")
+
+COMPRESSORS = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=6, mtime=0),
+}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+if zstandard is not None:
+    COMPRESSORS["zstd"] = zstandard.ZstdCompressor(level=6).compress
+
+
+@lru_cache(maxsize=128)
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported content coding from an Accept-Encoding header, or None."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in COMPRESSORS:
+            continue
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """Compress response bodies of at least `minimum_size` bytes with the best
+    encoding the client accepts.
+
+    Responses that already carry a Content-Encoding (the pre-compressed bodies
+    served from `response_cache`) and streamed responses pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            # First body message: decide once for the whole response
+            passthrough = True
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=list(start_message["headers"]))
+            if (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+            ):
+                await send(start_message)
+                await send(message)
+                return
+
+            body = COMPRESSORS[encoding](body)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            start_message["headers"] = headers.raw
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+# Serialized Response Cache
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '300'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '512'))
+
+# Bumped by every write handler; cached bodies built from an older version are stale
+data_versions: Dict[str, int] = {"bookings": 0, "contact_messages": 0}
+
+
+def bump_data_version(table: str):
+    data_versions[table] += 1
+    invalidation_channel.publish(table)
+
+
+# Cross-Worker Invalidation
+# Set by `main()`; under gunicorn, point every worker at the same directory
+INVALIDATION_SOCKET_DIR = os.environ.get('INVALIDATION_SOCKET_DIR')
+
+
+class InvalidationChannel:
+    """Broadcast data-version bumps to sibling workers on the same host.
+
+    Each worker binds a Unix datagram socket named after its pid inside a
+    shared directory; publishing sends the table name to every other socket
+    there, and receivers bump their own `data_versions` so cached bodies go
+    stale immediately. Without a directory the channel is a no-op.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = Path(directory) if directory else None
+        self._sock = None
+        self._path = None
+
+    def open(self):
+        if self.directory is None or not hasattr(socket, "AF_UNIX"):
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._path = self.directory / f"{os.getpid()}.sock"
+        self._path.unlink(missing_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(str(self._path))
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._receive)
+
+    def close(self):
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        self._path.unlink(missing_ok=True)
+
+    def publish(self, table: str):
+        if self._sock is None:
+            return
+        message = table.encode()
+        for peer in self.directory.glob("*.sock"):
+            if peer == self._path:
+                continue
+            try:
+                self._sock.sendto(message, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that died without cleaning up
+                peer.unlink(missing_ok=True)
+            except OSError as e:
+                # Peer's queue is full; the cache TTL still bounds its staleness
+                logger.warning("Invalidation to %s failed: %s", peer.name, e)
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._sock.recv(256)
+            except BlockingIOError:
+                return
+            table = message.decode()
+            if table in data_versions:
+                data_versions[table] += 1
+
+
+invalidation_channel = InvalidationChannel(INVALIDATION_SOCKET_DIR)
+
+
+class CachedBody:
+    """A serialized JSON body plus its compressed variants, built lazily per encoding."""
+
+    __slots__ = ("version", "expires_at", "identity", "encoded")
+
+    def __init__(self, version: int, expires_at: float, identity: bytes):
+        self.version = version
+        self.expires_at = expires_at
+        self.identity = identity
+        self.encoded: Dict[str, bytes] = {}
+
+    def encode(self, encoding: str) -> bytes:
+        body = self.encoded.get(encoding)
+        if body is None:
+            body = self.encoded[encoding] = COMPRESSORS[encoding](self.identity)
+        return body
+
+
+class ResponseCache:
+    """LRU of serialized read responses keyed by endpoint and data version.
+
+    The TTL only bounds staleness from writes made outside this process.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedBody]" = OrderedDict()
+
+    def get(self, key: str, version: int) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.version != version or entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, version: int, body: bytes) -> CachedBody:
+        entry = CachedBody(version, time.monotonic() + self.ttl_seconds, body)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES)
+# Kept apart so public per-date lookups can never evict the admin list bodies
+availability_cache = ResponseCache(RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def cached_json_response(request: Request, entry: CachedBody) -> Response:
+    headers = {"Vary": "Accept-Encoding"}
+    body = entry.identity
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+        if encoding is not None:
+            body = entry.encode(encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Idempotency
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', '10000'))
+
+
+class IdempotentResponse:
+    __slots__ = ("request_hash", "body", "expires_at")
+
+    def __init__(self, request_hash: str, body: str, expires_at: float):
+        self.request_hash = request_hash
+        self.body = body
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """Bounded, TTL-limited memory of responses to POSTs that carried an
+    Idempotency-Key, plus the requests for a key that are still in flight.
+
+    The `idempotency_keys` table is the fallback once an entry has been
+    evicted or the process restarted.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, IdempotentResponse]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def get(self, key: str) -> Optional[IdempotentResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def put(self, key: str, request_hash: str, body: str, age_seconds: float = 0.0) -> IdempotentResponse:
+        expires_at = time.monotonic() + self.ttl_seconds - age_seconds
+        entry = IdempotentResponse(request_hash, body, expires_at)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def in_flight(self, key: str) -> Optional[asyncio.Future]:
+        return self._in_flight.get(key)
+
+    def claim(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        return future
+
+    def release(self, key: str, future: asyncio.Future):
+        # Waiters only need the wake-up; they re-check the store themselves
+        del self._in_flight[key]
+        future.set_result(None)
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_ENTRIES)
+
+
+def replay_idempotent_response(entry: IdempotentResponse, request_hash: str) -> Response:
+    if entry.request_hash != request_hash:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request payload",
+        )
+    return Response(
+        content=entry.body,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def load_idempotent_response(key: str) -> Optional[IdempotentResponse]:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    client = create_client(turso_url, auth_token=turso_token)
+    try:
+        rs = await client.execute(
+            "SELECT request_hash, response_body, created_at FROM idempotency_keys WHERE key = ? AND created_at >= ?",
+            [key, cutoff.isoformat()]
+        )
+    finally:
+        await client.close()
+
+    if not rs.rows:
+        return None
+    request_hash, body, created_at = rs.rows[0]
+    age = (datetime.now(timezone.utc) - datetime.fromisoformat(created_at)).total_seconds()
+    return idempotency_store.put(key, request_hash, body, age_seconds=age)
+
+
+async def execute_batch(statements: list):
+    """Run statements in a single transaction and round-trip."""
+    client = create_client(turso_url, auth_token=turso_token)
+    try:
+        await client.batch(statements)
+    finally:
+        await client.close()
+
+
+# Submission Spool
+# When set, public submissions are acknowledged once they are in this local
+# SQLite file and a background drainer replays them to the primary
+SUBMISSION_SPOOL_PATH = os.environ.get('SUBMISSION_SPOOL_PATH')
+SPOOL_BATCH_SIZE = int(os.environ.get('SPOOL_BATCH_SIZE', '50'))
+SPOOL_POLL_SECONDS = float(os.environ.get('SPOOL_POLL_SECONDS', '2'))
+SPOOL_RETRY_MIN_SECONDS = 1.0
+SPOOL_RETRY_MAX_SECONDS = float(os.environ.get('SPOOL_RETRY_MAX_SECONDS', '60'))
+# Rejections by a reachable primary before an entry is parked as a dead letter
+SPOOL_MAX_ATTEMPTS = int(os.environ.get('SPOOL_MAX_ATTEMPTS', '5'))
+SPOOL_PRUNE_INTERVAL_SECONDS = 300.0
+
+
+class SubmissionSpool:
+    """Durable local queue of accepted submissions awaiting the primary.
+
+    Entries are keyed by row id (or by idempotency key) and committed with
+    synchronous=FULL before the client is answered. Every statement in an
+    entry is safe to replay, so a batch that reached the primary but lost
+    its reply is simply sent again. Drained entries are kept for
+    IDEMPOTENCY_TTL_SECONDS so a retried key still replays its original
+    response; entries the primary keeps rejecting are parked as dead
+    letters. Workers sharing the file elect a single drainer through a
+    lock file.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = Path(path) if path else None
+        self.drained = 0
+        self.last_error: Optional[str] = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._wakeup = None
+        self._drainer = None
+        self._next_prune = 0.0
+        self._schema_ready = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def open(self):
+        if not self.enabled:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS submissions (
+                id TEXT PRIMARY KEY,
+                tbl TEXT NOT NULL,
+                statements TEXT NOT NULL,
+                request_hash TEXT,
+                response_body TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        # Columns added after the first spool files were written
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(submissions)")}
+        for column, definition in (
+            ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+            ("last_error", "TEXT"),
+            ("drained_at", "TEXT"),
+            ("failed_at", "TEXT"),
+        ):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE submissions ADD COLUMN {column} {definition}")
+        conn.execute("CREATE INDEX IF NOT EXISTS submissions_state ON submissions (drained_at, failed_at)")
+        self._conn = conn
+
+        depth = self.depth()
+        if depth:
+            logger.info("Resuming %d undrained submissions from %s", depth, self.path)
+        self._wakeup = asyncio.Event()
+        self._drainer = asyncio.get_running_loop().create_task(self._drain_forever())
+
+    async def close(self):
+        if self._drainer is not None:
+            self._drainer.cancel()
+            try:
+                await self._drainer
+            except asyncio.CancelledError:
+                pass
+            self._drainer = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def append(self, entry_id: str, table: str, statements: list, request_hash: Optional[str], body: str):
+        """Durably queue an entry; returns the (request_hash, body) already spooled under `entry_id`, if any."""
+        existing = await asyncio.to_thread(self._append, entry_id, table, statements, request_hash, body)
+        if existing is None:
+            self._wakeup.set()
+        return existing
+
+    @contextmanager
+    def _transaction(self):
+        """One fsync for everything done inside, instead of one per statement."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _append(self, entry_id, table, statements, request_hash, body):
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        with self._transaction() as conn:
+            # A drained key past the TTL is free to be used again
+            conn.execute(
+                "DELETE FROM submissions WHERE id = ? AND drained_at IS NOT NULL AND created_at < ?",
+                [entry_id, cutoff.isoformat()]
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO submissions (id, tbl, statements, request_hash, response_body, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [entry_id, table, json.dumps(statements), request_hash, body, now.isoformat()]
+            )
+            if cursor.rowcount:
+                return None
+            return conn.execute(
+                "SELECT request_hash, response_body FROM submissions WHERE id = ?", [entry_id]
+            ).fetchone()
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM submissions WHERE drained_at IS NULL AND failed_at IS NULL"
+            ).fetchone()[0]
+
+    def oldest(self) -> Optional[str]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(created_at) FROM submissions WHERE drained_at IS NULL AND failed_at IS NULL"
+            ).fetchone()[0]
+
+    def dead_letters(self, limit: int = 50) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, tbl, attempts, last_error, created_at, failed_at FROM submissions WHERE failed_at IS NOT NULL ORDER BY rowid LIMIT ?",
+                [limit]
+            ).fetchall()
+        return [
+            {"id": r[0], "table": r[1], "attempts": r[2], "last_error": r[3], "created_at": r[4], "failed_at": r[5]}
+            for r in rows
+        ]
+
+    def dead_letter_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM submissions WHERE failed_at IS NOT NULL").fetchone()[0]
+
+    def _peek(self, limit: int) -> list:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, tbl, statements FROM submissions WHERE drained_at IS NULL AND failed_at IS NULL ORDER BY rowid LIMIT ?",
+                [limit]
+            ).fetchall()
+
+    def _mark_drained(self, entry_ids: list):
+        now = datetime.now(timezone.utc).isoformat()
+        with self._transaction() as conn:
+            # Only keyed entries are ever replayed; don't keep client details on disk for the rest
+            conn.executemany(
+                "DELETE FROM submissions WHERE id = ? AND request_hash IS NULL",
+                [(i,) for i in entry_ids]
+            )
+            conn.executemany(
+                "UPDATE submissions SET drained_at = ?, last_error = NULL WHERE id = ?",
+                [(now, i) for i in entry_ids]
+            )
+
+    def _record_failure(self, entry_id: str, error: str) -> bool:
+        """Count a rejection of `entry_id`; returns True once it is parked as a dead letter."""
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE submissions
+                SET attempts = attempts + 1,
+                    last_error = ?,
+                    failed_at = CASE WHEN attempts + 1 >= ? THEN ? ELSE NULL END
+                WHERE id = ?
+                """,
+                [error, SPOOL_MAX_ATTEMPTS, datetime.now(timezone.utc).isoformat(), entry_id]
+            )
+            return self._conn.execute(
+                "SELECT failed_at IS NOT NULL FROM submissions WHERE id = ?", [entry_id]
+            ).fetchone()[0] == 1
+
+    def _prune(self):
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM submissions WHERE drained_at IS NOT NULL AND (request_hash IS NULL OR created_at < ?)",
+                [cutoff.isoformat()]
+            )
+
+    def _try_lead(self) -> bool:
+        if self._lock_file is not None or fcntl is None:
+            return True
+        lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def _drain_forever(self):
+        backoff = SPOOL_RETRY_MIN_SECONDS
+        while True:
+            try:
+                handled = await self._drain_once()
+            except Exception as e:
+                # Anything, including a broken spool file, backs off rather than ending the drainer
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning("Draining spooled submissions failed, retrying in %.0fs: %s", backoff, self.last_error)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, SPOOL_RETRY_MAX_SECONDS)
+                continue
+
+            backoff = SPOOL_RETRY_MIN_SECONDS
+            if not handled:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), SPOOL_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _drain_once(self) -> int:
+        """Send one batch to the primary; returns how many entries were handled."""
+        self._wakeup.clear()
+        if not self._try_lead():
+            return 0
+
+        if time.monotonic() >= self._next_prune:
+            await asyncio.to_thread(self._prune)
+            self._next_prune = time.monotonic() + SPOOL_PRUNE_INTERVAL_SECONDS
+
+        entries = await asyncio.to_thread(self._peek, SPOOL_BATCH_SIZE)
+        if not entries:
+            # Nothing pending, so nothing is failing either
+            self.last_error = None
+            return 0
+
+        if not self._schema_ready:
+            # Startup may have run while the primary was unreachable
+            await create_schema()
+            self._schema_ready = True
+
+        try:
+            await execute_batch([stmt for entry in entries for stmt in self._statements(entry)])
+        except Exception as e:
+            logger.warning("Batch of %d spooled submissions failed, retrying one at a time: %s", len(entries), e)
+        else:
+            await self._finish(entries)
+            self.last_error = None
+            return len(entries)
+
+        # Isolate the entry that sank the batch so it can't hold up the rest
+        drained = []
+        rejected = None
+        try:
+            for entry in entries:
+                try:
+                    await execute_batch(self._statements(entry))
+                except Exception as e:
+                    if not await primary_reachable():
+                        raise
+                    rejected = e
+                    error = f"{type(e).__name__}: {e}"
+                    if await asyncio.to_thread(self._record_failure, entry[0], error):
+                        logger.error("Parked spooled submission %s as a dead letter: %s", entry[0], error)
+                else:
+                    drained.append(entry)
+        finally:
+            await self._finish(drained)
+
+        if rejected is not None:
+            # Back off before retrying entries that were rejected but not yet parked
+            raise rejected
+        self.last_error = None
+        return len(entries)
+
+    async def _finish(self, entries: list):
+        if not entries:
+            return
+        await asyncio.to_thread(self._mark_drained, [entry[0] for entry in entries])
+        self.drained += len(entries)
+        for table in {entry[1] for entry in entries}:
+            bump_data_version(table)
+
+    @staticmethod
+    def _statements(entry) -> list:
+        return [tuple(stmt) for stmt in json.loads(entry[2])]
+
+
+async def primary_reachable() -> bool:
+    try:
+        await execute_batch(["SELECT 1"])
+    except Exception:
+        return False
+    return True
+
+
+submission_spool = SubmissionSpool(SUBMISSION_SPOOL_PATH)
+
+
+# Completes every row insert; `guard_statement` supplies its arguments. A row
+# whose Idempotency-Key the primary already holds is skipped, so a replayed
+# or re-spooled submission can't add a second row.
+IDEMPOTENCY_GUARD = "WHERE NOT EXISTS (SELECT 1 FROM idempotency_keys WHERE key = ? AND created_at >= ?)"
+
+
+def guard_statement(statement: tuple, key: Optional[str]) -> tuple:
+    sql, args = statement
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    return (sql, [*args, key, cutoff.isoformat()])
+
+
+def idempotency_record_statements(key: str, request_hash: str, body: str, or_ignore: bool = False) -> list:
+    """Statements recording `key`, replacing a row for it that has outlived the TTL.
+
+    Startup pruning alone would leave an expired row in place, and reusing
+    its key would then fail the primary key with nothing left to replay.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    verb = "INSERT OR IGNORE" if or_ignore else "INSERT"
+    return [
+        ("DELETE FROM idempotency_keys WHERE key = ? AND created_at < ?", [key, cutoff.isoformat()]),
+        (
+            f"{verb} INTO idempotency_keys (key, request_hash, response_body, created_at) VALUES (?, ?, ?, ?)",
+            [key, request_hash, body, now.isoformat()]
+        ),
+    ]
+
+
+async def submit_write(table: str, statement: tuple, obj: BaseModel, payload: BaseModel, idempotency_key: Optional[str]):
+    """Persist a public submission, honouring an optional Idempotency-Key.
+
+    A repeated key replays the first response without writing, and
+    concurrent duplicates wait for the first request to finish. The key is
+    recorded in the same transaction as the row, so a duplicate this
+    process no longer remembers fails on the primary key and replays instead.
+
+    With the submission spool enabled the write is queued locally and the
+    primary is never consulted; the spool keeps keyed entries for the TTL
+    after draining, so a retry from any worker on this host replays. A key
+    only the primary knows is caught by IDEMPOTENCY_GUARD when draining.
+    """
+    key = f"{table}:{idempotency_key}" if idempotency_key else None
+    statement = guard_statement(statement, key)
+
+    if not idempotency_key:
+        if submission_spool.enabled:
+            await submission_spool.append(obj.id, table, [statement], None, obj.model_dump_json())
+        else:
+            await execute_batch([statement])
+            bump_data_version(table)
+        return obj
+
+    request_hash = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+    while True:
+        stored = idempotency_store.get(key)
+        if stored is not None:
+            return replay_idempotent_response(stored, request_hash)
+        pending = idempotency_store.in_flight(key)
+        if pending is None:
+            break
+        await asyncio.shield(pending)
+
+    future = idempotency_store.claim(key)
+    try:
+        if submission_spool.enabled:
+            body = obj.model_dump_json()
+            existing = await submission_spool.append(
+                key, table,
+                [statement, *idempotency_record_statements(key, request_hash, body, or_ignore=True)],
+                request_hash, body
+            )
+            if existing is not None:
+                stored = idempotency_store.put(key, *existing)
+                return replay_idempotent_response(stored, request_hash)
+            idempotency_store.put(key, request_hash, body)
+            return Response(content=body, media_type="application/json")
+
+        # No lookup before writing: a key that is only on the primary (evicted,
+        # restarted, or another worker's) fails the insert and is replayed below
+        body = obj.model_dump_json()
+        try:
+            await execute_batch([statement, *idempotency_record_statements(key, request_hash, body)])
+        except LibsqlError:
+            stored = await load_idempotent_response(key)
+            if stored is None:
+                raise
+            return replay_idempotent_response(stored, request_hash)
+
+        bump_data_version(table)
+        idempotency_store.put(key, request_hash, body)
+        return Response(content=body, media_type="application/json")
+    finally:
+        idempotency_store.release(key, future)
+
+
 # Database Helper
 async def get_db():
     client = create_client(turso_url, auth_token=turso_token)
@@ -148,6 +945,16 @@ async def startup_db():
         print("TURSO_DATABASE_URL not set, skipping DB init")
         return
 
+    try:
+        await create_schema()
+    except Exception as e:
+        if not submission_spool.enabled:
+            raise
+        # Keep accepting submissions; the drainer creates the schema once the primary is back
+        logger.warning("Could not initialise the primary, deferring to the spool drainer: %s", e)
+
+
+async def create_schema():
     client = create_client(turso_url, auth_token=turso_token)
     try:
         # Create Bookings table
@@ -176,6 +983,18 @@ async def startup_db():
                 created_at TEXT NOT NULL
             )
         """)
+
+        # Create Idempotency Keys table and drop expired keys
+        await client.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                request_hash TEXT NOT NULL,
+                response_body TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        await client.execute("DELETE FROM idempotency_keys WHERE created_at < ?", [cutoff.isoformat()])
     finally:
         await client.close()
 
@@ -206,41 +1025,42 @@ async def root():
 
 # Booking Routes (Public)
 @api_router.post("/bookings", response_model=Booking)
-async def create_booking(booking_input: BookingCreate):
+async def create_booking(booking_input: BookingCreate, idempotency_key: Optional[str] = Header(None, max_length=255)):
     booking_obj = Booking(**booking_input.model_dump())
     
     # Convert created_at to ISO string for storage
     created_at_iso = booking_obj.created_at.isoformat()
     
-    client = create_client(turso_url, auth_token=turso_token)
-    try:
-        await client.execute(
-            """
-            INSERT INTO bookings (id, client_name, client_email, client_phone, service_type, booking_date, booking_time, message, status, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            [
-                booking_obj.id,
-                booking_obj.client_name,
-                booking_obj.client_email,
-                booking_obj.client_phone,
-                booking_obj.service_type.value,
-                booking_obj.booking_date,
-                booking_obj.booking_time,
-                booking_obj.message,
-                booking_obj.status.value,
-                created_at_iso
-            ]
-        )
-    finally:
-        await client.close()
-        
-    return booking_obj
+    statement = (
+        f"""
+        INSERT OR IGNORE INTO bookings (id, client_name, client_email, client_phone, service_type, booking_date, booking_time, message, status, created_at)
+        SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ? {IDEMPOTENCY_GUARD}
+        """,
+        [
+            booking_obj.id,
+            booking_obj.client_name,
+            booking_obj.client_email,
+            booking_obj.client_phone,
+            booking_obj.service_type.value,
+            booking_obj.booking_date,
+            booking_obj.booking_time,
+            booking_obj.message,
+            booking_obj.status.value,
+            created_at_iso
+        ]
+    )
+    return await submit_write("bookings", statement, booking_obj, booking_input, idempotency_key)
 
 
 # Protected Admin Routes
 @api_router.get("/bookings", response_model=List[Booking])
-async def get_bookings(email: str = Depends(verify_token)):
+async def get_bookings(request: Request, email: str = Depends(verify_token)):
+    # Capture the version before querying so a concurrent write invalidates what we build
+    version = data_versions["bookings"]
+    cached = response_cache.get("bookings", version)
+    if cached is not None:
+        return cached_json_response(request, cached)
+
     client = create_client(turso_url, auth_token=turso_token)
     try:
         rs = await client.execute("SELECT * FROM bookings ORDER BY created_at DESC LIMIT 1000")
@@ -264,11 +1084,12 @@ async def get_bookings(email: str = Depends(verify_token)):
                 data['created_at'] = datetime.fromisoformat(data['created_at'])
             
             bookings.append(Booking(**data))
-            
-        return bookings
     finally:
         await client.close()
 
+    cached = response_cache.put("bookings", version, booking_list_adapter.dump_json(bookings))
+    return cached_json_response(request, cached)
+
 
 @api_router.get("/bookings/{booking_id}", response_model=Booking)
 async def get_booking(booking_id: str, email: str = Depends(verify_token)):
@@ -305,7 +1126,8 @@ async def update_booking_status(booking_id: str, update: BookingUpdate, email: s
             "UPDATE bookings SET status = ? WHERE id = ?",
             [update.status.value, booking_id]
         )
-        
+        bump_data_version("bookings")
+
         # Fetch updated
         rs = await client.execute("SELECT * FROM bookings WHERE id = ?", [booking_id])
         row = rs.rows[0]
@@ -333,40 +1155,41 @@ async def delete_booking(booking_id: str, email: str = Depends(verify_token)):
              pass
     finally:
         await client.close()
-        
+
+    bump_data_version("bookings")
     return {"message": "Booking deleted successfully"}
 
 
 # Contact Routes
 @api_router.post("/contact", response_model=ContactMessage)
-async def create_contact_message(message_input: ContactMessageCreate):
+async def create_contact_message(message_input: ContactMessageCreate, idempotency_key: Optional[str] = Header(None, max_length=255)):
     message_obj = ContactMessage(**message_input.model_dump())
     
     created_at_iso = message_obj.created_at.isoformat()
     
-    client = create_client(turso_url, auth_token=turso_token)
-    try:
-        await client.execute(
-            """
-            INSERT INTO contact_messages (id, name, email, message, created_at)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            [
-                message_obj.id,
-                message_obj.name,
-                message_obj.email,
-                message_obj.message,
-                created_at_iso
-            ]
-        )
-    finally:
-        await client.close()
-        
-    return message_obj
+    statement = (
+        f"""
+        INSERT OR IGNORE INTO contact_messages (id, name, email, message, created_at)
+        SELECT ?, ?, ?, ?, ? {IDEMPOTENCY_GUARD}
+        """,
+        [
+            message_obj.id,
+            message_obj.name,
+            message_obj.email,
+            message_obj.message,
+            created_at_iso
+        ]
+    )
+    return await submit_write("contact_messages", statement, message_obj, message_input, idempotency_key)
 
 
 @api_router.get("/contact", response_model=List[ContactMessage])
-async def get_contact_messages(email: str = Depends(verify_token)):
+async def get_contact_messages(request: Request, email: str = Depends(verify_token)):
+    version = data_versions["contact_messages"]
+    cached = response_cache.get("contact_messages", version)
+    if cached is not None:
+        return cached_json_response(request, cached)
+
     client = create_client(turso_url, auth_token=turso_token)
     try:
         rs = await client.execute("SELECT * FROM contact_messages ORDER BY created_at DESC LIMIT 1000")
@@ -381,11 +1204,14 @@ async def get_contact_messages(email: str = Depends(verify_token)):
                 data['created_at'] = datetime.fromisoformat(data['created_at'])
             
             messages.append(ContactMessage(**data))
-            
-        return messages
     finally:
         await client.close()
 
+    cached = response_cache.put(
+        "contact_messages", version, contact_message_list_adapter.dump_json(messages)
+    )
+    return cached_json_response(request, cached)
+
 
 @api_router.delete("/contact/{message_id}")
 async def delete_contact_message(message_id: str, email: str = Depends(verify_token)):
@@ -394,13 +1220,45 @@ async def delete_contact_message(message_id: str, email: str = Depends(verify_to
         await client.execute("DELETE FROM contact_messages WHERE id = ?", [message_id])
     finally:
         await client.close()
-        
+
+    bump_data_version("contact_messages")
     return {"message": "Message deleted successfully"}
 
 
+@api_router.get("/spool")
+async def get_spool_status(email: str = Depends(verify_token)):
+    if not submission_spool.enabled:
+        return {"enabled": False}
+    depth = await asyncio.to_thread(submission_spool.depth)
+    oldest = await asyncio.to_thread(submission_spool.oldest)
+    dead_letter_count = await asyncio.to_thread(submission_spool.dead_letter_count)
+    dead_letters = await asyncio.to_thread(submission_spool.dead_letters)
+    return {
+        "enabled": True,
+        "depth": depth,
+        "oldest_created_at": oldest,
+        "drained": submission_spool.drained,
+        "last_error": submission_spool.last_error,
+        "dead_letter_count": dead_letter_count,
+        "dead_letters": dead_letters,
+    }
+
+
 # Time Slots Route (Public)
 @api_router.get("/available-times")
-async def get_available_times(date: str):
+async def get_available_times(request: Request, date: str):
+    # Normalise before caching so arbitrary strings can't become cache keys
+    try:
+        date = calendar_date.fromisoformat(date).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=422, detail="date must be an ISO date (YYYY-MM-DD)")
+
+    cache_key = f"available-times:{date}"
+    version = data_versions["bookings"]
+    cached = availability_cache.get(cache_key, version)
+    if cached is not None:
+        return cached_json_response(request, cached)
+
     client = create_client(turso_url, auth_token=turso_token)
     try:
         # SQLite queries
@@ -419,12 +1277,16 @@ async def get_available_times(date: str):
     ]
     
     available_times = [t for t in all_times if t not in booked_times]
-    return {"available_times": available_times, "booked_times": booked_times}
+    body = json.dumps({"available_times": available_times, "booked_times": booked_times})
+    cached = availability_cache.put(cache_key, version, body.encode())
+    return cached_json_response(request, cached)
 
 
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -441,7 +1303,55 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@app.on_event("startup")
+async def startup_app():
+    invalidation_channel.open()
+    submission_spool.open()
+
+
 @app.on_event("shutdown")
 async def shutdown_app():
-    # Cleanup if needed
-    pass
+    await submission_spool.close()
+    invalidation_channel.close()
+
+
+def worker_count() -> int:
+    configured = os.environ.get('WEB_CONCURRENCY')
+    if configured:
+        return max(1, int(configured))
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def main():
+    """Serve the API with one uvicorn worker per available CPU.
+
+    Workers share an invalidation directory so a write in any of them
+    invalidates cached reads in all of them. WEB_CONCURRENCY overrides the
+    worker count.
+    """
+    import uvicorn
+
+    socket_dir = os.environ.get('INVALIDATION_SOCKET_DIR')
+    owns_socket_dir = socket_dir is None
+    if owns_socket_dir:
+        socket_dir = tempfile.mkdtemp(prefix="diesel-workers-")
+        os.environ['INVALIDATION_SOCKET_DIR'] = socket_dir
+
+    try:
+        uvicorn.run(
+            "server:app",
+            app_dir=str(ROOT_DIR),
+            host=os.environ.get('HOST', '0.0.0.0'),
+            port=int(os.environ.get('PORT', '8000')),
+            workers=worker_count(),
+        )
+    finally:
+        if owns_socket_dir:
+            shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import requests
 import sys
 import json
+import random
+import time
+import uuid
 from datetime import datetime, timedelta
 
 class DieselMediaAPITester:
@@ -10,11 +13,14 @@ class DieselMediaAPITester:
         self.tests_passed = 0
         self.test_results = []
         self.admin_token = None
+        self.last_response = None
+        self.spool_enabled = False
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, params=None, auth_required=False):
+    def run_test(self, name, method, endpoint, expected_status, data=None, params=None, auth_required=False, headers=None):
         """Run a single API test"""
         url = f"{self.base_url}/{endpoint}"
-        headers = {'Content-Type': 'application/json'}
+        extra_headers = headers or {}
+        headers = {'Content-Type': 'application/json', **extra_headers}
         
         # Add auth header if required and token available
         if auth_required and self.admin_token:
@@ -32,6 +38,7 @@ class DieselMediaAPITester:
                 response = requests.patch(url, json=data, headers=headers)
             elif method == 'DELETE':
                 response = requests.delete(url, headers=headers)
+            self.last_response = response
 
             success = response.status_code == expected_status
             if success:
@@ -71,6 +78,23 @@ class DieselMediaAPITester:
             })
             return False, {}
 
+    def record_check(self, name, passed, detail=""):
+        """Record an assertion about a response that the status code alone can't express"""
+        self.tests_run += 1
+        print(f"\n🔍 Checking {name}...")
+        if passed:
+            self.tests_passed += 1
+            print("✅ Passed")
+        else:
+            print(f"❌ Failed - {detail}")
+        self.test_results.append({
+            "name": name,
+            "method": "CHECK",
+            "success": passed,
+            "detail": detail
+        })
+        return passed
+
     def test_root_endpoint(self):
         """Test root API endpoint"""
         return self.run_test("Root API", "GET", "", 200)
@@ -203,6 +227,153 @@ class DieselMediaAPITester:
         success, response = self.run_test("Get Available Times", "GET", "available-times", 200, params={"date": tomorrow})
         return success
 
+    def test_idempotent_booking_replay(self):
+        """Test that a retried booking with the same Idempotency-Key replays the original"""
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+        booking_data = {
+            "client_name": "Retry Client",
+            "client_email": "retry@example.com",
+            "client_phone": "5551234567",
+            "service_type": "event",
+            "booking_date": tomorrow,
+            "booking_time": "11:00 AM"
+        }
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        success, first = self.run_test("Create Booking (Idempotency-Key)", "POST", "bookings", 200, data=booking_data, headers=headers)
+        if not success:
+            return None
+        success, second = self.run_test("Retry Booking (Same Key)", "POST", "bookings", 200, data=booking_data, headers=headers)
+        if success:
+            replayed = self.last_response.headers.get("Idempotent-Replayed")
+            self.record_check("Retry Replays Original Booking",
+                              second.get("id") == first.get("id") and replayed == "true",
+                              f"ids={first.get('id')}/{second.get('id')} Idempotent-Replayed={replayed}")
+
+        changed = {**booking_data, "client_name": "Someone Else"}
+        self.run_test("Reuse Key With Different Payload", "POST", "bookings", 422, data=changed, headers=headers)
+        return first.get("id")
+
+    def test_idempotent_contact_replay(self):
+        """Test that a retried contact message with the same Idempotency-Key replays the original"""
+        message_data = {
+            "name": "Retry Sender",
+            "email": "retry@example.com",
+            "message": "Sent twice over a flaky connection."
+        }
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        success, first = self.run_test("Create Contact Message (Idempotency-Key)", "POST", "contact", 200, data=message_data, headers=headers)
+        if not success:
+            return False
+        success, second = self.run_test("Retry Contact Message (Same Key)", "POST", "contact", 200, data=message_data, headers=headers)
+        if success:
+            replayed = self.last_response.headers.get("Idempotent-Replayed")
+            success = self.record_check("Retry Replays Original Contact Message",
+                                        second.get("id") == first.get("id") and replayed == "true",
+                                        f"ids={first.get('id')}/{second.get('id')} Idempotent-Replayed={replayed}")
+        return success
+
+    def test_spool_status_unauthorized(self):
+        """Test getting spool status without auth (should fail)"""
+        success, _ = self.run_test("Spool Status (Unauthorized)", "GET", "spool", 403)
+        return success
+
+    def test_spool_status(self):
+        """Test the spool status shape, and that an accepted submission drains"""
+        if not self.admin_token:
+            print("⚠️ Skipping spool status - no admin token available")
+            return False
+        success, status = self.run_test("Spool Status (Protected)", "GET", "spool", 200, auth_required=True)
+        if not success:
+            return False
+
+        self.spool_enabled = status.get("enabled") is True
+        if not self.spool_enabled:
+            return self.record_check("Spool Status Disabled Shape", status == {"enabled": False}, f"status={status}")
+
+        expected_keys = {"enabled", "depth", "oldest_created_at", "drained", "last_error", "dead_letter_count", "dead_letters"}
+        self.record_check("Spool Status Shape", expected_keys <= set(status) and isinstance(status["depth"], int)
+                          and isinstance(status["dead_letters"], list), f"status={status}")
+
+        message_data = {
+            "name": "Spool Check",
+            "email": "spool@example.com",
+            "message": "Accepted while the primary may be slow."
+        }
+        success, _ = self.run_test("Create Contact Message (Spooled)", "POST", "contact", 200, data=message_data)
+        if not success:
+            return False
+        for _ in range(20):
+            _, status = self.run_test("Spool Status (Draining)", "GET", "spool", 200, auth_required=True)
+            if status.get("depth") == 0:
+                break
+            time.sleep(0.5)
+        return self.record_check("Spool Drains Accepted Submission",
+                                 status.get("depth") == 0 and status.get("last_error") is None, f"status={status}")
+
+    def test_available_times_invalid_date(self):
+        """Test that a malformed date is rejected rather than cached"""
+        success, _ = self.run_test("Get Available Times (Invalid Date)", "GET", "available-times", 422, params={"date": "not-a-date"})
+        return success
+
+    def test_available_times_reflect_new_booking(self):
+        """Test that a new booking shows up in available times right away"""
+        day = (datetime.now() + timedelta(days=random.randint(400, 1400))).strftime("%Y-%m-%d")
+        # Warm the cached body for this date first
+        self.run_test("Get Available Times (Before Booking)", "GET", "available-times", 200, params={"date": day})
+        booking_data = {
+            "client_name": "Cache Check",
+            "client_email": "cache@example.com",
+            "client_phone": "5551234567",
+            "service_type": "event",
+            "booking_date": day,
+            "booking_time": "02:00 PM"
+        }
+        success, response = self.run_test("Create Booking (Availability)", "POST", "bookings", 200, data=booking_data)
+        if not success:
+            return None
+
+        # With the submission spool enabled the booking is visible once drained
+        attempts = 20 if self.spool_enabled else 1
+        booked = []
+        for _ in range(attempts):
+            _, times = self.run_test("Get Available Times (After Booking)", "GET", "available-times", 200, params={"date": day})
+            booked = times.get("booked_times", [])
+            if "02:00 PM" in booked:
+                break
+            time.sleep(0.5)
+        self.record_check("Available Times Reflect New Booking", "02:00 PM" in booked, f"booked_times={booked}")
+        return response.get('id')
+
+    def test_response_compression(self):
+        """Test Content-Encoding negotiation above and below COMPRESSION_MIN_SIZE"""
+        min_size = 1024  # server default COMPRESSION_MIN_SIZE
+
+        success, _ = self.run_test("Small Response (gzip accepted)", "GET", "", 200, headers={"Accept-Encoding": "gzip"})
+        if success:
+            encoding = self.last_response.headers.get("Content-Encoding")
+            self.record_check("Small Response Not Compressed", encoding is None, f"Content-Encoding={encoding}")
+
+        if not self.admin_token:
+            print("⚠️ Skipping large response compression - no admin token available")
+            return False
+
+        success, _ = self.run_test("Bookings List (gzip preferred)", "GET", "bookings", 200, auth_required=True,
+                                   headers={"Accept-Encoding": "br;q=0.5, gzip"})
+        if success:
+            # requests transparently decodes, so content is the uncompressed body
+            size = len(self.last_response.content)
+            encoding = self.last_response.headers.get("Content-Encoding")
+            expected = "gzip" if size >= min_size else None
+            self.record_check("Bookings List Encoding Negotiated", encoding == expected,
+                              f"size={size} Content-Encoding={encoding} expected={expected}")
+
+        success, _ = self.run_test("Bookings List (identity only)", "GET", "bookings", 200, auth_required=True,
+                                   headers={"Accept-Encoding": "identity"})
+        if success:
+            encoding = self.last_response.headers.get("Content-Encoding")
+            self.record_check("Identity Request Not Compressed", encoding is None, f"Content-Encoding={encoding}")
+        return success
+
     def test_delete_booking_protected(self, booking_id):
         """Test deleting a booking (protected endpoint)"""
         if not booking_id:
@@ -224,7 +395,8 @@ class DieselMediaAPITester:
 
 def main():
     print("🚀 Starting Diesel Media API Tests with Authentication...")
-    tester = DieselMediaAPITester()
+    # Optionally point at another deployment, e.g. http://localhost:8000/api
+    tester = DieselMediaAPITester(*sys.argv[1:2])
 
     # Test root endpoint
     tester.test_root_endpoint()
@@ -256,6 +428,24 @@ def main():
     tester.test_update_booking_status_protected(booking_id)
     tester.test_get_contact_messages_protected()
 
+    # Test the submission spool status endpoint
+    print("\n📮 Testing Submission Spool...")
+    tester.test_spool_status_unauthorized()
+    tester.test_spool_status()
+
+    # Test Idempotency-Key handling on public submissions
+    print("\n🔁 Testing Idempotent Submissions...")
+    idempotent_booking_id = tester.test_idempotent_booking_replay()
+    tester.test_idempotent_contact_replay()
+    tester.test_delete_booking_protected(idempotent_booking_id)
+
+    # Test response compression and cached availability
+    print("\n📦 Testing Compression and Caching...")
+    tester.test_response_compression()
+    tester.test_available_times_invalid_date()
+    availability_booking_id = tester.test_available_times_reflect_new_booking()
+    tester.test_delete_booking_protected(availability_booking_id)
+
     # Test delete booking (cleanup) - protected
     tester.test_delete_booking_protected(booking_id)
 
@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { X, ChevronRight, ChevronLeft, Check } from "lucide-react";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
@@ -13,6 +13,7 @@ import {
 } from "@/components/ui/select";
 import { toast } from "sonner";
 import axios from "axios";
+import { newIdempotencyKey } from "@/lib/utils";
 import { format, addDays, isBefore, startOfDay } from "date-fns";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
@@ -32,6 +33,7 @@ export default function BookingModal({ isOpen, onClose, preSelectedService }) {
   const [isLoadingTimes, setIsLoadingTimes] = useState(false);
   const [isSubmitting, setIsSubmitting] = useState(false);
   const [bookingComplete, setBookingComplete] = useState(false);
+  const idempotencyKey = useRef(null);
 
   const [formData, setFormData] = useState({
     service_type: preSelectedService || "",
@@ -43,6 +45,11 @@ export default function BookingModal({ isOpen, onClose, preSelectedService }) {
     message: "",
   });
 
+  // A changed form is a new submission, not a retry of the last one
+  useEffect(() => {
+    idempotencyKey.current = newIdempotencyKey();
+  }, [formData]);
+
   useEffect(() => {
     if (preSelectedService) {
       setFormData((prev) => ({ ...prev, service_type: preSelectedService }));
@@ -87,7 +94,9 @@ export default function BookingModal({ isOpen, onClose, preSelectedService }) {
   const handleSubmit = async () => {
     setIsSubmitting(true);
     try {
-      await axios.post(`${API}/bookings`, formData);
+      await axios.post(`${API}/bookings`, formData, {
+        headers: { "Idempotency-Key": idempotencyKey.current },
+      });
       setBookingComplete(true);
       toast.success("Booking submitted successfully!");
     } catch (error) {
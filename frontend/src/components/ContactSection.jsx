@@ -1,4 +1,4 @@
-import { useState } from "react";
+import { useState, useEffect, useRef } from "react";
 import { motion } from "framer-motion";
 import { Mail, Phone, MapPin, Send } from "lucide-react";
 import { Button } from "@/components/ui/button";
@@ -6,6 +6,7 @@ import { Input } from "@/components/ui/input";
 import { Textarea } from "@/components/ui/textarea";
 import { toast } from "sonner";
 import axios from "axios";
+import { newIdempotencyKey } from "@/lib/utils";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
@@ -29,6 +30,12 @@ export default function ContactSection() {
     message: "",
   });
   const [isSubmitting, setIsSubmitting] = useState(false);
+  const idempotencyKey = useRef(null);
+
+  // A changed form is a new submission, not a retry of the last one
+  useEffect(() => {
+    idempotencyKey.current = newIdempotencyKey();
+  }, [formData]);
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -41,7 +48,9 @@ export default function ContactSection() {
     setIsSubmitting(true);
 
     try {
-      await axios.post(`${API}/contact`, formData);
+      await axios.post(`${API}/contact`, formData, {
+        headers: { "Idempotency-Key": idempotencyKey.current },
+      });
       toast.success("Message sent! We'll get back to you soon.");
       setFormData({ name: "", email: "", message: "" });
     } catch (error) {